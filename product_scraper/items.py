@@ -1,14 +1,71 @@
-import scrapy
-
-
-class ProductItem(scrapy.Item):
-    name = scrapy.Field()
-    url = scrapy.Field()
-    sku = scrapy.Field()
-    productID = scrapy.Field()
-    image = scrapy.Field()
-    price = scrapy.Field()
-    description = scrapy.Field()
-    main_category = scrapy.Field()
-    sub_categories = scrapy.Field()
-    variant_name = scrapy.Field()
\ No newline at end of file
+from collections.abc import KeysView
+from typing import Any, Optional
+
+import msgspec
+from itemadapter import ItemAdapter
+from itemadapter.adapter import AdapterInterface
+
+
+class ProductItem(msgspec.Struct, omit_defaults=True):
+    """
+    A scraped product or product variant.
+
+    Unset fields are None and are left out when the item is encoded.
+    Field types are not checked when an item is built: sku, productID, price and description
+    keep whatever JSON type the page's structured data uses.
+    """
+    name: Optional[str] = None
+    url: Optional[str] = None
+    sku: Any = None
+    productID: Any = None
+    image: Optional[str] = None
+    price: Any = None
+    description: Any = None
+    main_category: Optional[str] = None
+    sub_categories: Optional[str] = None
+    variant_name: Optional[str] = None
+
+
+class StructAdapter(AdapterInterface):
+    """
+    Lets Scrapy (pipelines, feed exports, item loaders) handle msgspec Structs as items.
+
+    A field set to None counts as missing, like an unset field of a scrapy.Item.
+    """
+
+    @classmethod
+    def is_item_class(cls, item_class):
+        return issubclass(item_class, msgspec.Struct)
+
+    @classmethod
+    def get_field_names_from_class(cls, item_class):
+        return list(item_class.__struct_fields__)
+
+    def field_names(self):
+        return KeysView(dict.fromkeys(self.item.__struct_fields__))
+
+    def __getitem__(self, field_name):
+        if field_name in self.item.__struct_fields__:
+            value = getattr(self.item, field_name)
+            if value is not None:
+                return value
+        raise KeyError(field_name)
+
+    def __setitem__(self, field_name, value):
+        if field_name not in self.item.__struct_fields__:
+            raise KeyError(f"{self.item.__class__.__name__} does not support field: {field_name}")
+        setattr(self.item, field_name, value)
+
+    def __delitem__(self, field_name):
+        self[field_name]  # Raises KeyError if the field is not set
+        setattr(self.item, field_name, None)
+
+    def __iter__(self):
+        return (name for name in self.item.__struct_fields__ if getattr(self.item, name) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# Checked before the built-in adapters
+ItemAdapter.ADAPTER_CLASSES.appendleft(StructAdapter)
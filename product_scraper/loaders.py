@@ -1,8 +1,11 @@
 from scrapy.loader import ItemLoader
 from itemloaders.processors import TakeFirst, MapCompose, Identity
 
+from .items import ProductItem
+
 
 class ProductLoader(ItemLoader):
+    default_item_class = ProductItem
     default_output_processor = TakeFirst()
 
     name_in = MapCompose(str.strip)
@@ -16,4 +19,4 @@ class ProductLoader(ItemLoader):
     main_category_in = MapCompose(str.strip)
     sub_categories_in = MapCompose(str.strip)
     specifications_in = Identity()
-    variant_name_in = MapCompose(str.strip)
\ No newline at end of file
+    variant_name_in = MapCompose(str.strip)
@@ -1,5 +1,18 @@
+from importlib import import_module
+from time import time
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
 from itemadapter import is_item, ItemAdapter
+from scrapy_selenium.http import SeleniumRequest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+from twisted.internet.defer import DeferredQueue
+from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThread
 
 
 class ProductScraperSpiderMiddleware:
@@ -94,3 +107,179 @@ class ProductScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class SeleniumDriverPoolMiddleware:
+    """
+    Downloader middleware that renders SeleniumRequests on a pool of persistent drivers.
+
+    - Drivers are started lazily, up to SELENIUM_DRIVER_POOL_SIZE, and reused across requests.
+    - Page loads run in Twisted's thread pool so the reactor keeps scheduling other requests.
+    - The driver stays checked out after the response is returned, so the spider can keep
+      interacting with the page; it must call response.meta["release_driver"]() when done.
+    - A driver that fails with a WebDriverException is discarded and its pool slot freed.
+    - Responses are returned before the request reaches a downloader slot, so Scrapy's per-domain
+      delay and AutoThrottle never see them; page loads on the same domain are instead spaced
+      DOWNLOAD_DELAY seconds apart here.
+    """
+
+    def __init__(self, driver_name, driver_executable_path, driver_arguments,
+                 browser_executable_path, pool_size, download_delay):
+        webdriver_base_path = f'selenium.webdriver.{driver_name}'
+
+        self.driver_klass = import_module(f'{webdriver_base_path}.webdriver').WebDriver
+        self.driver_options_klass = import_module(f'{webdriver_base_path}.options').Options
+        self.driver_service_klass = import_module(f'{webdriver_base_path}.service').Service
+
+        self.driver_executable_path = driver_executable_path
+        self.driver_arguments = driver_arguments or []
+        self.browser_executable_path = browser_executable_path
+
+        self.pool_size = pool_size
+        self.num_drivers = 0                   # Drivers started or starting
+        self.drivers = []                      # Every started driver, for shutdown
+        self.idle_drivers = DeferredQueue()    # Drivers ready to take a request, or None for a freed slot
+
+        self.download_delay = download_delay
+        self.next_load_at = {}                 # Earliest start of the next page load, per domain
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        driver_name = crawler.settings.get('SELENIUM_DRIVER_NAME')
+        driver_executable_path = crawler.settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH')
+
+        if not driver_name or not driver_executable_path:
+            raise NotConfigured(
+                'SELENIUM_DRIVER_NAME and SELENIUM_DRIVER_EXECUTABLE_PATH must be set'
+            )
+
+        s = cls(
+            driver_name=driver_name,
+            driver_executable_path=driver_executable_path,
+            driver_arguments=crawler.settings.getlist('SELENIUM_DRIVER_ARGUMENTS'),
+            browser_executable_path=crawler.settings.get('SELENIUM_BROWSER_EXECUTABLE_PATH'),
+            pool_size=crawler.settings.getint('SELENIUM_DRIVER_POOL_SIZE', 8),
+            download_delay=crawler.settings.getfloat('DOWNLOAD_DELAY'),
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    async def process_request(self, request, spider):
+        # Plain requests (e.g. sitemaps) go through Scrapy's regular downloader
+        if not isinstance(request, SeleniumRequest):
+            return None
+
+        driver = await self._acquire_driver()
+        try:
+            await self._wait_for_turn(request)
+            return await maybe_deferred_to_future(deferToThread(self._render, request, driver))
+        except TimeoutException:
+            # wait_until expired: the page is slow, the browser is fine
+            self.idle_drivers.put(driver)
+            raise
+        except WebDriverException:
+            # The browser may be dead; don't hand it to the next request
+            self._discard_driver(driver)
+            raise
+        except Exception:
+            self.idle_drivers.put(driver)
+            raise
+
+    async def _acquire_driver(self):
+        """
+        Return an idle driver, starting a new one if none is idle and the pool is not full.
+        Waiting for a driver does not hold a thread.
+        """
+        while True:
+            if not self.idle_drivers.pending and self.num_drivers < self.pool_size:
+                self.num_drivers += 1
+                try:
+                    return await maybe_deferred_to_future(deferToThread(self._create_driver))
+                except Exception:
+                    self._free_slot()
+                    raise
+
+            driver = await maybe_deferred_to_future(self.idle_drivers.get())
+            if driver is not None:
+                return driver
+            # A slot was freed: loop around to start a new driver in it
+
+    async def _wait_for_turn(self, request):
+        """
+        Wait until DOWNLOAD_DELAY has passed since the last page load started on the request's domain.
+        """
+        if not self.download_delay:
+            return
+
+        from twisted.internet import reactor
+
+        domain = urlparse_cached(request).hostname
+        now = time()
+        load_at = max(now, self.next_load_at.get(domain, 0))
+        self.next_load_at[domain] = load_at + self.download_delay
+        if load_at > now:
+            await maybe_deferred_to_future(deferLater(reactor, load_at - now))
+
+    def _free_slot(self):
+        """
+        Give back the pool slot of a driver that failed to start or was discarded,
+        waking a waiting request so it can start a new driver in it.
+        """
+        self.num_drivers -= 1
+        self.idle_drivers.put(None)
+
+    def _discard_driver(self, driver):
+        if driver in self.drivers:
+            self.drivers.remove(driver)
+        deferToThread(self._quit_driver, driver)
+        self._free_slot()
+
+    @staticmethod
+    def _quit_driver(driver):
+        # Runs in a worker thread: the browser may already be gone
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _create_driver(self):
+        # Runs in a worker thread: starting a browser takes seconds
+        driver_options = self.driver_options_klass()
+        if self.browser_executable_path:
+            driver_options.binary_location = self.browser_executable_path
+        for argument in self.driver_arguments:
+            driver_options.add_argument(argument)
+
+        driver = self.driver_klass(
+            service=self.driver_service_klass(executable_path=self.driver_executable_path),
+            options=driver_options,
+        )
+        self.drivers.append(driver)
+        return driver
+
+    def _render(self, request, driver):
+        # Runs in a worker thread: load the page and wrap it into a Scrapy response
+        driver.get(request.url)
+
+        if request.wait_until:
+            WebDriverWait(driver, request.wait_time).until(request.wait_until)
+
+        if request.screenshot:
+            request.meta['screenshot'] = driver.get_screenshot_as_png()
+
+        if request.script:
+            driver.execute_script(request.script)
+
+        body = str.encode(driver.page_source)
+
+        # Lend the driver to the spider together with the way to give it back
+        request.meta.update({
+            'driver': driver,
+            'release_driver': lambda: self.idle_drivers.put(driver),
+        })
+
+        return HtmlResponse(driver.current_url, body=body, encoding='utf-8', request=request)
+
+    def spider_closed(self, spider):
+        for driver in self.drivers:
+            driver.quit()
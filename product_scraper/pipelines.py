@@ -1,4 +1,7 @@
+import os
+from itemadapter import ItemAdapter
 from scrapy.exceptions import DropItem
+from pybloom_live import ScalableBloomFilter
 import logging
 
 
@@ -6,46 +9,93 @@ class ProductScraperPipeline:
     """
     A Scrapy pipeline to clean and deduplicate product items.
 
-    - Filters out duplicate SKUs.
+    - Filters out duplicate SKUs using a Bloom filter (~29 bits per SKU) that grows once full.
+      A SKU is dropped as a probable duplicate; about one in a million new SKUs is a false positive.
+    - Persists the filter between runs so incremental crawls skip SKUs seen before
+      (set FRESH_CRAWL=1 to start from an empty filter). Such a crawl only emits new SKUs,
+      so the product feed is appended to rather than overwritten (see resumes_crawl).
     - Tracks basic stats for logging and reporting.
     """
 
+    # Bloom filter sizing: ~7 MB for the first 2M SKUs with a 1-in-a-million false-positive rate;
+    # each further filter is 4x larger (a ScalableBloomFilter never raises once full)
+    BLOOM_CAPACITY = 2_000_000
+    BLOOM_ERROR_RATE = 1e-6
+
+    # Where the filter is kept between crawls
+    SEEN_SKUS_PATH = os.path.join('product_data', 'seen_skus.bloom')
+
     def __init__(self):
-        # Track already-seen SKUs to avoid duplicates
-        self.seen_skus = set()
+        # Track already-seen SKUs to avoid duplicates, including those from previous crawls
+        self.seen = self._load_seen_skus()
 
         # Statistics to log at the end of the crawl
-        self.stats = {
-            "processed": 0,  # Successfully accepted items
-            "dropped": 0,    # Dropped due to duplication or bad data
-            "errors": 0,     # External error tracking (can be incremented elsewhere)
-        }
+        self.processed = 0  # Successfully accepted items
+        self.dropped = 0    # Dropped due to duplication or bad data
+        self.errors = 0     # External error tracking (can be incremented elsewhere)
 
     def process_item(self, item, spider):
-        sku = item.get('sku')
+        sku = ItemAdapter(item).get('sku')
 
         # ── Check for duplicate SKUs ──
-        if sku in self.seen_skus:
-            self.stats["dropped"] += 1
-            raise DropItem(f"Duplicate item found: {sku}")
+        # add() returns True when every bit was already set, i.e. the SKU was (almost certainly) seen
+        if self.seen.add(sku):
+            self.dropped += 1
+            raise DropItem(f"Probable duplicate item found (this or an earlier crawl): {sku}")
 
         # ── Passed all checks ──
-        self.seen_skus.add(sku)
-        self.stats["processed"] += 1
+        self.processed += 1
         return item
 
+    @classmethod
+    def resumes_crawl(cls):
+        """
+        Whether this crawl continues from the filter saved by an earlier one,
+        i.e. only emits SKUs that earlier crawls did not.
+        """
+        return os.environ.get("FRESH_CRAWL") != "1" and os.path.exists(cls.SEEN_SKUS_PATH)
+
+    def _load_seen_skus(self):
+        """
+        Load the SKU filter saved by the previous crawl, or start an empty one.
+        An unreadable saved filter is logged and replaced by an empty one.
+        """
+        if self.resumes_crawl():
+            try:
+                with open(self.SEEN_SKUS_PATH, 'rb') as f:
+                    return ScalableBloomFilter.fromfile(f)
+            except Exception as e:
+                # The feed is still appended to, so earlier SKUs are written again rather than lost
+                logging.warning(
+                    f"Ignoring unreadable SKU filter {self.SEEN_SKUS_PATH}, "
+                    f"SKUs from earlier crawls will be emitted again: {e}"
+                )
+
+        return ScalableBloomFilter(
+            initial_capacity=self.BLOOM_CAPACITY,
+            error_rate=self.BLOOM_ERROR_RATE,
+            mode=ScalableBloomFilter.LARGE_SET_GROWTH,
+        )
+
     def close_spider(self, spider):
         """
         Called automatically when the spider closes.
 
-        Logs a summary and pushes stats to Scrapy's stats collector.
+        Saves the SKU filter, logs a summary and pushes stats to Scrapy's stats collector.
         """
+        # Write a temporary file and swap it in, so an interrupted save never leaves a truncated filter
+        os.makedirs(os.path.dirname(self.SEEN_SKUS_PATH), exist_ok=True)
+        tmp_path = f"{self.SEEN_SKUS_PATH}.tmp"
+        with open(tmp_path, 'wb') as f:
+            self.seen.tofile(f)
+        os.replace(tmp_path, self.SEEN_SKUS_PATH)
+
         logging.info("Product scraping summary:")
-        logging.info(f"Processed: {self.stats['processed']}")
-        logging.info(f"Duplicates/Invalid Dropped: {self.stats['dropped']}")
-        logging.info(f"Failed URLs: {self.stats['errors']}")
+        logging.info(f"Processed: {self.processed}")
+        logging.info(f"Duplicates/Invalid Dropped: {self.dropped}")
+        logging.info(f"Failed URLs: {self.errors}")
 
         # Push stats into Scrapy’s internal stats collector (useful for dashboards/logging)
-        spider.crawler.stats.set_value("products_processed", self.stats['processed'])
-        spider.crawler.stats.set_value("products_dropped_duplicates", self.stats['dropped'])
-        spider.crawler.stats.set_value("product_page_errors", self.stats['errors'])  # Tracked elsewhere
\ No newline at end of file
+        spider.crawler.stats.set_value("products_processed", self.processed)
+        spider.crawler.stats.set_value("products_dropped_duplicates", self.dropped)
+        spider.crawler.stats.set_value("product_page_errors", self.errors)  # Tracked elsewhere
@@ -6,10 +6,14 @@ NEWSPIDER_MODULE = "product_scraper.spiders"
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
-# Configure maximum concurrent requests performed by Scrapy
-CONCURRENT_REQUESTS = 8
-
-# Configure a delay for requests for the same website
+# Configure maximum concurrent requests performed by Scrapy.
+# Tuned with SELENIUM_DRIVER_POOL_SIZE: requests beyond the pool size queue for the next free
+# driver, and the thread pool must fit one thread per driver plus DNS lookups.
+CONCURRENT_REQUESTS = 16
+REACTOR_THREADPOOL_MAXSIZE = 20
+
+# Configure a delay for requests for the same website.
+# SeleniumDriverPoolMiddleware applies it to page loads itself, as they bypass the downloader slots
 DOWNLOAD_DELAY = 1
 
 # Disable cookies (enabled by default)
@@ -20,14 +24,16 @@ ITEM_PIPELINES = {
    "product_scraper.pipelines.ProductScraperPipeline": 300,
 }
 
+# AutoThrottle only adjusts plain requests (e.g. sitemaps); Selenium page loads never reach it
 AUTOTHROTTLE_ENABLED = True
 AUTOTHROTTLE_START_DELAY = 1
 AUTOTHROTTLE_MAX_DELAY = 5
 
-# Enable scrapy-selenium middleware
+# Render SeleniumRequests on a pool of persistent drivers
 DOWNLOADER_MIDDLEWARES = {
-    'scrapy_selenium.SeleniumMiddleware': 800,  # Enable selenium middleware
+    'product_scraper.middlewares.SeleniumDriverPoolMiddleware': 800,
 }
+SELENIUM_DRIVER_POOL_SIZE = 8
 SELENIUM_DRIVER_NAME = 'chrome'
 SELENIUM_DRIVER_EXECUTABLE_PATH = r"C:\Users\ADMIN\WebDrivers\chromedriver.exe"
 SELENIUM_DRIVER_ARGUMENTS = ['--headless', '--disable-gpu', '--no-sandbox']
@@ -36,3 +42,8 @@ SELENIUM_DRIVER_ARGUMENTS = ['--headless', '--disable-gpu', '--no-sandbox']
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
+
+# Serialize JSON Lines feeds with msgspec, written in batches
+FEED_EXPORTERS = {
+    'jsonl': 'product_scraper.exporters.MsgspecLinesExporter',
+}
@@ -1,19 +1,93 @@
 import scrapy
-import json
-import numpy as np
-from itertools import product
+import ijson
+import msgspec
+import orjson
 import re
 import os
-import time
 
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy_selenium.http import SeleniumRequest
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import TimeoutException
+from twisted.internet.threads import deferToThread
 
 from ..items import ProductItem
 from ..loaders import ProductLoader
+from ..pipelines import ProductScraperPipeline
+
+# Return the product and breadcrumb JSON-LD script bodies in one round trip
+_STRUCTURED_DATA_JS = """
+return [
+    document.getElementById('product-structured-data-script')?.innerHTML,
+    document.getElementById('breadcrumblist-structured-data-script')?.innerHTML,
+]
+"""
+
+# Return the variant section of the product page, or null when the product has no variants
+_VARIANT_BLOCK_JS = """return document.querySelector('div[class="hidden lg:block"]')"""
+
+# Return the product JSON-LD of the currently selected variant in one round trip
+_PRODUCT_DATA_JS = "return document.getElementById('product-structured-data-script')?.innerHTML"
+
+# Whether a variant option is the currently selected one (checked radio, aria state or active class)
+_OPTION_SELECTED_JS = """
+const option = arguments[0];
+return Boolean(
+    option.matches('[aria-checked="true"], [aria-selected="true"], .active, .selected')
+    || option.querySelector('input:checked, [aria-checked="true"], [aria-selected="true"]')
+);
+"""
+
+# Feature name in a variant caption label, e.g. "Color" in "Color: Red"
+_CAPTION_RE = re.compile(r'([\w\s]+):')
+
+
+def _take_first(value):
+    """
+    Like the loader's TakeFirst for a raw JSON-LD value: the first non-empty element of a list.
+    """
+    if isinstance(value, list):
+        return next((v for v in value if v is not None and v != ''), None)
+    return value
+
+
+def _product_json_changed(previous):
+    """
+    WebDriverWait condition that returns the product JSON-LD once it differs from `previous`.
+    """
+    def condition(driver):
+        current = driver.execute_script(_PRODUCT_DATA_JS)
+        return current if current != previous else False
+    return condition
+
+
+def _gray_code(radices):
+    """
+    Walk every combination of option indices in reflected (mixed-radix) Gray code order,
+    so consecutive combinations differ in exactly one axis.
+    Yields (changed_axes, combination); the first step reports every axis as changed.
+    """
+    if not radices or 0 in radices:
+        return
+
+    combination = [0] * len(radices)
+    directions = [1] * len(radices)
+    yield range(len(radices)), tuple(combination)
+
+    while True:
+        # Move the fastest axis that can still move; axes at their end reverse direction
+        for axis in reversed(range(len(radices))):
+            index = combination[axis] + directions[axis]
+            if 0 <= index < radices[axis]:
+                combination[axis] = index
+                yield (axis,), tuple(combination)
+                break
+            directions[axis] = -directions[axis]
+        else:
+            return
+
 
 class ProductSpider(scrapy.Spider):
     name = "product_spider"
@@ -30,129 +104,195 @@ class ProductSpider(scrapy.Spider):
         'RETRY_HTTP_CODES': [500, 502, 503, 504, 522, 524, 408, 429],
         'DOWNLOAD_TIMEOUT': 15,
 
-        # Output data to a file in the product_data directory
+        # Output data to a JSON Lines file in the product_data directory
         'FEEDS': {
-            'product_data/products.json': {
-                'format': 'json',
+            'product_data/products.jsonl': {
+                'format': 'jsonl',
                 'encoding': 'utf8',
                 'store_empty': False,
-                'overwrite': True,
             }
         }
     }
 
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+
+        # A crawl resuming from the saved SKU filter only emits new SKUs, so it must append to
+        # the items of earlier crawls instead of truncating them
+        feeds = settings.getdict('FEEDS')
+        if 'product_data/products.jsonl' in feeds:
+            feeds['product_data/products.jsonl'] = {
+                **feeds['product_data/products.jsonl'],
+                'overwrite': not ProductScraperPipeline.resumes_crawl(),
+            }
+            settings.set('FEEDS', feeds, priority='spider')
+
     def start_requests(self):
         """
-        Load product URLs from a JSON file and issue Selenium requests.
+        Stream product URLs from a JSON Lines file and issue Selenium requests.
         Ensures the directory exists and handles errors gracefully.
         """
         # Ensure the output directory exists
         os.makedirs('product_data', exist_ok=True)
 
-        # Path to the product links JSON file
+        # Path to the product links JSON Lines file
         json_file_path = os.path.join(
             os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
             'product_data',
-            'product_links.json'
+            'product_links.jsonl'
         )
 
         try:
-            # Read the product links
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                product_urls = json.load(f)
-
-            # Send SeleniumRequest for each URL
-            for url in product_urls:
-                yield SeleniumRequest(
-                    url=url,
-                    callback=self.parse,
-                    errback=self.handle_error,
-                    wait_time=5  # Let the page fully render
-                )
+            # Stream the product links so requests are scheduled while the file is still being parsed
+            with open(json_file_path, 'rb') as f:
+                # Send SeleniumRequest for each URL
+                for url in ijson.items(f, '', multiple_values=True):
+                    yield SeleniumRequest(
+                        url=url,
+                        callback=self.parse,
+                        errback=self.handle_error,
+                        wait_time=5  # Let the page fully render
+                    )
 
         except FileNotFoundError:
             self.logger.error(f"JSON file not found: {json_file_path}")
-        except json.JSONDecodeError as e:
+        except ijson.JSONError as e:
             self.logger.error(f"Failed to parse JSON file: {e}")
 
-    def parse(self, response):
+    async def parse(self, response):
         """
         Entry point for each product page. Handles base product data and optional variants.
+        The Selenium work runs in a worker thread; the driver goes back to the pool afterwards.
         """
         driver = response.meta["driver"]
 
-        # Scrape the main product info
-        yield self.parse_product_data(driver)
+        try:
+            items = await maybe_deferred_to_future(deferToThread(self.scrape_product, driver))
+        finally:
+            response.meta["release_driver"]()
+
+        for item in items:
+            yield item
+
+    def scrape_product(self, driver):
+        """
+        Collect the base product item and its variant items from the page loaded in `driver`.
+        Blocking: meant to run outside the reactor thread.
+        """
+        # Scrape the main product info; pages without product data yield nothing
+        base_item = next(self.parse_product_data(driver), None)
+        if base_item is None:
+            return []
+        items = [base_item]
 
         # Scrape the variants if available
         try:
-            yield from self.parse_product_variants(driver)
+            items.extend(self.parse_product_variants(driver, base_item))
         except Exception as e:
             self.logger.warning(f"No variant was found: {e}")
 
+        return items
+
     def parse_product_data(self, driver):
         """
         Extract core product information including structured data, breadcrumb categories,
         and specifications from the HTML using Selenium.
+        Yields nothing when the page has no usable product structured data
+        (e.g. a removed product or an error page).
         """
+        data, breadcrumb_data = self._read_structured_data(driver)
+        if not data:
+            self.logger.warning(f"No product structured data found at {driver.current_url}")
+            return
+
         loader = ProductLoader(item=ProductItem(), selector=None)
+        fields = {**self._extract_static(driver, data, breadcrumb_data), **self._extract_variant_fields(data)}
+        for key, value in fields.items():
+            loader.add_value(key, value)
+
+        # Return the populated item
+        yield loader.load_item()
+
+    def _read_structured_data(self, driver):
+        """
+        Read the product and breadcrumb JSON-LD scripts in a single round trip.
+        Both are server-rendered, so there is no need to wait for them to appear.
+        """
+        product_json, breadcrumb_json = driver.execute_script(_STRUCTURED_DATA_JS)
+        return (
+            self._decode_json_ld(driver, product_json, "product structured data"),
+            self._decode_json_ld(driver, breadcrumb_json, "breadcrumb data"),
+        )
+
+    def _decode_json_ld(self, driver, script_data, label):
+        """
+        Decode a JSON-LD script body. Returns an empty dict when it is missing or invalid.
+        """
+        if not script_data:
+            return {}
 
-        # ───── Parse JSON-LD Structured Product Data ─────
         try:
-            script_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//*[@id='product-structured-data-script']"))
-            )
-            script_data = script_element.get_attribute('innerHTML')
-
-            if script_data:
-                data = json.loads(script_data)
-                loader.add_value("name", data.get("name"))
-                loader.add_value("url", data.get("url"))
-                loader.add_value("sku", data.get("sku"))
-                loader.add_value("productID", data.get("productID"))
-                loader.add_value("image", data.get("image"))
-                loader.add_value("price", data.get("offers", {}).get("price"))
-                loader.add_value("description", data.get("description"))
-
-        except json.JSONDecodeError:
-            self.logger.warning(f"Failed to decode product structured data at {driver.current_url}")
+            return orjson.loads(script_data)
+        except orjson.JSONDecodeError:
+            self.logger.warning(f"Failed to decode {label} at {driver.current_url}")
+            return {}
+
+    def _extract_static(self, driver, data, breadcrumb_data):
+        """
+        Extract the fields shared by every variant of the product:
+        name, url and description from the structured data, and the breadcrumb categories.
+        """
+        # ───── JSON-LD Structured Product Data ─────
+        fields = {
+            "name": data.get("name"),
+            "url": data.get("url"),
+            "description": data.get("description"),
+        }
 
         # ───── Breadcrumb Categories from JSON-LD ─────
         try:
-            breadcrumb_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//*[@id='breadcrumblist-structured-data-script']"))
-            )
-            breadcrumb_json = breadcrumb_element.get_attribute('innerHTML')
-            if breadcrumb_json:
-                breadcrumb_data = json.loads(breadcrumb_json)
-                breadcrumbs = breadcrumb_data.get("itemListElement", [])
-
-                if len(breadcrumbs) >= 3:
-                    # Extract main category and sub-categories (excluding home/product page)
-                    loader.add_value("main_category", breadcrumbs[1].get("name"))
-                    sub_cats = [b.get("name") for b in breadcrumbs[2:-1] if b.get("name")]
-                    loader.add_value("sub_categories", sub_cats)
-                elif len(breadcrumbs) == 2:
-                    loader.add_value("main_category", breadcrumbs[1].get("name"))
-
-        except (json.JSONDecodeError, TypeError, KeyError) as e:
+            breadcrumbs = breadcrumb_data.get("itemListElement", [])
+
+            if len(breadcrumbs) >= 3:
+                # Extract main category and sub-categories (excluding home/product page)
+                fields["main_category"] = breadcrumbs[1].get("name")
+                fields["sub_categories"] = [b.get("name") for b in breadcrumbs[2:-1] if b.get("name")]
+            elif len(breadcrumbs) == 2:
+                fields["main_category"] = breadcrumbs[1].get("name")
+
+        except (TypeError, KeyError) as e:
             self.logger.warning(f"Breadcrumb parsing error on {driver.current_url}: {e}")
 
-        # Return the populated item
-        yield loader.load_item()
+        return fields
 
-    def parse_product_variants(self, driver):
+    def _extract_variant_fields(self, data):
+        """
+        Extract the fields that change with the selected variant: sku, productID, image and price.
+        """
+        # Variant items skip the loader, so normalise like it does: lists (e.g. several images
+        # or offers) become their first element and the image URL is stripped
+        image = _take_first(data.get("image"))
+        offers = _take_first(data.get("offers"))
+        return {
+            "sku": _take_first(data.get("sku")),
+            "productID": _take_first(data.get("productID")),
+            "image": image.strip() if isinstance(image, str) else image,
+            "price": _take_first(offers.get("price")) if isinstance(offers, dict) else None,
+        }
+
+    def parse_product_variants(self, driver, base_item):
         """
         Extracts and simulates clicks for all combinations of product variant options,
         generating distinct items for each variant combination.
+        Each variant item is a copy of `base_item` with the variant-specific fields replaced.
         """
         try:
-            # Wait for the variant section to be present
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div[class="hidden lg:block"]'))
-            )
+            # Look the variant section up in a single round trip; skip products without one
+            variant_block = driver.execute_script(_VARIANT_BLOCK_JS)
+            if variant_block is None:
+                return
 
-            variant_block = driver.find_element(By.CSS_SELECTOR, 'div[class="hidden lg:block"]')
             features = variant_block.find_elements(By.CLASS_NAME, 'mb-3')
 
             num_variants = []     # Count of options per feature
@@ -171,34 +311,51 @@ class ProductSpider(scrapy.Spider):
                 all_variants.append(variants)
 
                 caption = feature.find_element(By.CSS_SELECTOR, 'div[class = "mb-2 caption"]')
-                variant_names.append(' '.join(re.findall(string = caption.text, pattern='([\w\s]+):')))
+                match = _CAPTION_RE.search(caption.text)
+                variant_names.append(match.group(1).strip() if match else '')
 
-            # Generate all combinations of variant options. Each combination is a unique set of indices.
-            num_options = [np.arange(i) for i in num_variants]
-            category_index = list(product(*num_options))
+            # The product JSON-LD is refreshed (via AJAX) once a clicked variant is applied
+            product_json = driver.execute_script(_PRODUCT_DATA_JS)
 
-            for combination in category_index:
-                combination = list(combination)
-                variant_parts = []
+            variant_parts = [None] * len(features)    # "Feature: option" label of the current selection
 
-                for i in range(len(combination)):
+            # Visit all combinations of variant options. Each combination is a unique set of indices;
+            # after the first one only a single feature changes, so only that option is clicked.
+            for step, (changed_axes, combination) in enumerate(_gray_code(num_variants)):
+                for i in changed_axes:
                     chosen_feature = all_variants[i][combination[i]]
-                    ActionChains(driver).move_to_element(chosen_feature).click().perform()
                     chosen_feature_info = chosen_feature.find_element(By.CSS_SELECTOR, 'div[class *= "relative"]').text
-                    variant_parts.append(f"{variant_names[i]}: {chosen_feature_info}")
+                    variant_parts[i] = f"{variant_names[i]}: {chosen_feature_info}"
 
-                variant_name = " | ".join(variant_parts)
+                    # On the first step, options the page already has selected need no click (and no refresh)
+                    if step == 0 and driver.execute_script(_OPTION_SELECTED_JS, chosen_feature):
+                        continue
+
+                    # Wait for the JSON-LD to reflect each click before the next one, so a refresh
+                    # is never charged to another option or variant
+                    ActionChains(driver).move_to_element(chosen_feature).click().perform()
+                    try:
+                        product_json = WebDriverWait(driver, 5).until(_product_json_changed(product_json))
+                    except TimeoutException:
+                        if step > 0:
+                            # A late refresh could land on any later variant: stop walking this product
+                            self.logger.warning(
+                                f"Variant data did not refresh after selecting '{variant_parts[i]}' "
+                                f"on {driver.current_url}, skipping the remaining variants"
+                            )
+                            return
+                        # First step: nothing changed for the whole wait, so the option was already
+                        # applied and the current JSON-LD stays the baseline for the next click
 
-                # Load base product data again after clicking variant
-                loader = ProductLoader(item=ProductItem(), selector=None)
-                item = next(self.parse_product_data(driver))
-                for key, value in item.items():
-                    loader.add_value(key, value)
-                loader.add_value("variant_name", variant_name)
+                variant_name = " | ".join(variant_parts)
 
-                time.sleep(2)
+                # Only the fields that change after clicking variant come from the refreshed JSON-LD
+                data = self._decode_json_ld(driver, product_json, "product structured data")
+                variant_fields = {
+                    key: value for key, value in self._extract_variant_fields(data).items() if value is not None
+                }
 
-                yield loader.load_item()
+                yield msgspec.structs.replace(base_item, variant_name=variant_name, **variant_fields)
 
         except Exception as e:
             self.logger.warning(f"Product parsing error on {driver.current_url}: {e}")
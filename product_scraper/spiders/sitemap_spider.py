@@ -1,6 +1,26 @@
 import scrapy
+import io
 import os
-import json
+import re
+import orjson
+import xxhash
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+# Selectors compiled once and applied to the parsed lxml tree of each response.
+# local-name() is used to ignore XML namespaces.
+_SITEMAP_LOCS = etree.XPath(
+    '//*[local-name()="sitemap"]/*[local-name()="loc"]/text()', smart_strings=False
+)
+_VARIANT_HREFS = etree.XPath(
+    HTMLTranslator().css_to_xpath('.mb-4 [class*="radio-content"] a::attr(href)'), smart_strings=False
+)
+
+# Sitemap URL routes as (regex, callback name) pairs, searched anywhere in the URL.
+# Rows are tried in order and the first one that matches wins; several rows may share a callback.
+_URL_ROUTES = (
+    (re.compile(r'-p-'), 'parse_url_based_variants'),  # Heuristic to identify product pages
+)
 
 
 class SitemapSpider(scrapy.Spider):
@@ -19,17 +39,22 @@ class SitemapSpider(scrapy.Spider):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # A set to store all collected URLs (ensures uniqueness)
-        self.collected_urls = set()
+        # 64-bit hashes of collected URLs (ensures uniqueness without keeping the URLs in memory)
+        self.seen = set()
+        self.url_count = 0
+
+        # URLs are appended to a JSON Lines file as they are discovered
+        output_dir = 'product_data'
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_path = os.path.join(output_dir, 'product_links.jsonl')
+        self.out = open(self.output_path, 'wb')
 
     def parse(self, response):
         """
         Parse the top-level sitemap index and request each sub-sitemap.
         Uses local-name() to ignore XML namespaces.
         """
-        sitemap_urls = response.xpath(
-            '//*[local-name()="sitemap"]/*[local-name()="loc"]/text()'
-        ).getall()
+        sitemap_urls = _SITEMAP_LOCS(response.selector.root)
 
         for sitemap_url in sitemap_urls:
             # Schedule a request to each child sitemap for further parsing
@@ -38,16 +63,27 @@ class SitemapSpider(scrapy.Spider):
     def parse_sitemap(self, response):
         """
         Parse each individual sitemap and look for product pages.
-        Product pages are identified by URLs containing "-p-".
+        URLs are routed to callbacks by _URL_ROUTES; product pages contain "-p-".
+        The XML is parsed incrementally ({*} ignores namespaces), so memory stays flat on large sitemaps.
         """
-        page_urls = response.xpath(
-            '//*[local-name()="url"]/*[local-name()="loc"]/text()'
-        ).getall()
+        # Like Scrapy's own sitemap parser: tolerate malformed XML (stray "&", truncated files)
+        # and very large documents instead of dropping the whole sitemap on the first error
+        url_elements = etree.iterparse(
+            io.BytesIO(response.body), events=('end',), tag='{*}url',
+            resolve_entities=False, recover=True, huge_tree=True,
+        )
 
-        for url in page_urls:
-            if "-p-" in url:  # Heuristic to identify product pages
-                # Go deeper to check if the product has URL-based variants
-                yield scrapy.Request(url=url, callback=self.parse_url_based_variants)
+        for _, url_element in url_elements:
+            url = (url_element.findtext('{*}loc') or '').strip()
+            callback_name = next((name for pattern, name in _URL_ROUTES if pattern.search(url)), None)
+            if callback_name:
+                # E.g. go deeper to check if the product has URL-based variants
+                yield scrapy.Request(url=url, callback=getattr(self, callback_name))
+
+            # Free the processed <url> element and any siblings already handled
+            url_element.clear()
+            while url_element.getprevious() is not None:
+                del url_element.getparent()[0]
 
     def parse_url_based_variants(self, response):
         """
@@ -61,26 +97,23 @@ class SitemapSpider(scrapy.Spider):
             # Typically rendered as <a> elements inside radio-content blocks
             urls += [
                 response.urljoin(href)
-                for href in response.css('.mb-4 [class*="radio-content"] a::attr(href)').getall()
+                for href in _VARIANT_HREFS(response.selector.root)
             ]
         except Exception as e:
             self.logger.warning(f"Error extracting variants from {response.url}: {e}")
 
-        # Add all unique URLs to the in-memory set
+        # Append each unseen URL to the output file
         for url in urls:
-            self.collected_urls.add(url)
+            url_hash = xxhash.xxh64_intdigest(url.encode())
+            if url_hash not in self.seen:
+                self.seen.add(url_hash)
+                self.out.write(orjson.dumps(url) + b'\n')
+                self.url_count += 1
 
     def closed(self, reason):
         """
-        When the spider finishes, dump the collected URLs to a JSON file.
-        Ensures the product_data folder exists and logs the output.
+        When the spider finishes, close the JSON Lines output and log the result.
         """
-        output_dir = 'product_data'
-        os.makedirs(output_dir, exist_ok=True)
-
-        output_path = os.path.join(output_dir, 'product_links.json')
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(sorted(self.collected_urls), f, ensure_ascii=False, indent=2)
+        self.out.close()
 
-        self.logger.info(f"Wrote {len(self.collected_urls)} URLs to {output_path}")
+        self.logger.info(f"Wrote {self.url_count} URLs to {self.output_path}")